@@ -1,9 +1,17 @@
 # [file name]: main.py
+import time
+
+# Measure how long each script run (first load or rerun) takes
+_run_start = time.perf_counter()
+
 import streamlit as st
 from streamlit_mic_recorder import speech_to_text
-from utils.agent import ResearchAgent
+from utils.agent import ResearchAgent, create_model
 from utils.audio import text_to_audio
-import time
+from utils.lazy import IMPORT_TIMES
+from utils.prefetch import get_prefetcher
+
+_imports_done = time.perf_counter()
 
 # --- PAGE CONFIG ---
 st.set_page_config(
@@ -39,6 +47,17 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+
+@st.cache_resource(show_spinner=False)
+def load_model(api_key):
+    """
+    Process-wide cached model client, built once per distinct key.
+    genai.configure is process-global, so every client (and session) uses the most
+    recently configured key; this app expects a single deployment key.
+    """
+    return create_model(api_key)
+
+
 # --- SESSION STATE INIT ---
 if "messages" not in st.session_state:
     st.session_state.messages = [
@@ -52,6 +71,10 @@ if "plan_sections" not in st.session_state:
     st.session_state.plan_sections = {}
 if "auto_play_audio" not in st.session_state:
     st.session_state.auto_play_audio = True
+if "deep_fetch" not in st.session_state:
+    st.session_state.deep_fetch = False
+if "watchlist" not in st.session_state:
+    st.session_state.watchlist = ""
 
 # --- SIDEBAR: CONFIGURATION ---
 with st.sidebar:
@@ -69,7 +92,7 @@ with st.sidebar:
     if api_key and not st.session_state.agent:
         try:
             with st.spinner("🔄 Initializing AI Agent..."):
-                st.session_state.agent = ResearchAgent(api_key)
+                st.session_state.agent = ResearchAgent(api_key, model=load_model(api_key))
                 st.success("✅ Agent Activated!")
                 # Add welcome message
                 if len(st.session_state.messages) == 1:
@@ -104,8 +127,45 @@ with st.sidebar:
         st.session_state.agent.update_persona(persona_prompts[persona], persona)
         st.markdown(f'<div class="persona-badge">Active: {persona}</div>', unsafe_allow_html=True)
 
+    # Deep fetch reads full pages instead of search snippets
+    st.session_state.deep_fetch = st.checkbox(
+        "Deep-fetch top results",
+        value=st.session_state.deep_fetch,
+        help="Download and read the full pages of top search hits (slower, richer financial data)"
+    )
+    if st.session_state.agent:
+        st.session_state.agent.deep_fetch = st.session_state.deep_fetch
+
+    st.markdown("---")
+
+    # WATCHLIST: companies kept warm by the background prefetcher
+    st.subheader("👀 Account Watchlist")
+    st.session_state.watchlist = st.text_input(
+        "Add companies to keep warm (comma-separated)",
+        value=st.session_state.watchlist,
+        help="Search data for these companies is refreshed in the background so questions about them answer "
+             "faster. The watchlist is shared by everyone using this app; the WATCHLIST environment variable "
+             "sets its base list."
+    )
+    prefetcher = get_prefetcher()
+    # Sessions only add to the shared watchlist; an empty input never clears it
+    prefetcher.add_companies(st.session_state.watchlist.split(","))
+    if prefetcher.watchlist:
+        prefetcher.start()
+        metrics = prefetcher.get_metrics()
+        with st.expander("📈 Refresh status"):
+            for company, stats in metrics["companies"].items():
+                age = f"{stats['age_seconds'] / 60:.0f} min ago" if stats["age_seconds"] is not None else "pending"
+                flag = "🟠 stale" if stats["stale"] else "🟢 fresh"
+                st.write(f"**{company.title()}** - {flag}, refreshed {age}, "
+                         f"{stats['refresh_count']} refreshes, {stats['failures']} failures")
+            st.caption(f"Warm hits: {metrics['hits']} • Misses: {metrics['misses']}")
+
     st.markdown("---")
 
+    # TOKEN USAGE: filled in at the end of the script so it includes this turn
+    usage_placeholder = st.empty()
+
     # 3. AUDIO SETTINGS
     st.subheader("🔊 Audio Settings")
     st.session_state.auto_play_audio = st.checkbox(
@@ -293,4 +353,36 @@ if user_query:
 
             # 7. Update account plan in sidebar if needed
             if plan_updates and st.session_state.plan_sections:
-                st.rerun()
\ No newline at end of file
+                st.rerun()
+
+# --- TOKEN USAGE (per-session accounting from the agent) ---
+if st.session_state.agent:
+    usage = st.session_state.agent.usage.summary()
+    session_usage = usage["session"]
+    with usage_placeholder.container():
+        st.subheader("🧮 Token Usage")
+        st.caption(f"{session_usage['total_tokens']:,} tokens • ~${session_usage['cost_usd']:.4f} this session")
+        with st.expander("📊 Breakdown"):
+            st.write("**By stage:**")
+            for stage, stats in usage["by_stage"].items():
+                st.write(f"- {stage}: {stats['total_tokens']:,} tokens in {stats['calls']} calls")
+            st.write("**By persona:**")
+            for persona_name, stats in usage["by_persona"].items():
+                st.write(f"- {persona_name}: {stats['total_tokens']:,} tokens")
+            if usage["estimated_calls"]:
+                st.caption(f"{usage['estimated_calls']} calls estimated locally (no SDK usage data)")
+
+        st.markdown("---")
+
+# --- STARTUP / RERUN TIMING ---
+_run_ms = (time.perf_counter() - _run_start) * 1000
+_import_ms = (_imports_done - _run_start) * 1000
+if "first_run_ms" not in st.session_state:
+    st.session_state.first_run_ms = _run_ms
+    print(f"⏱️ First run: {_run_ms:.0f} ms (imports {_import_ms:.0f} ms)")
+else:
+    print(f"⏱️ Rerun: {_run_ms:.0f} ms (imports {_import_ms:.0f} ms)")
+
+sdk_loads = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in IMPORT_TIMES.items())
+st.caption(f"⏱️ First load {st.session_state.first_run_ms:.0f} ms • This run {_run_ms:.0f} ms"
+           + (f" • Lazy loads: {sdk_loads}" if sdk_loads else ""))
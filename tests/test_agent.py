@@ -0,0 +1,175 @@
+# [file name]: test_agent.py
+from types import SimpleNamespace
+import threading
+import time
+
+import pytest
+
+from utils.agent import ResearchAgent
+from utils.resilience import CircuitBreaker
+from utils.usage import estimate_tokens
+
+
+class StubChat:
+    """Mimics the SDK ChatSession: history is only extended once a reply arrives."""
+
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history)
+
+    def send_message(self, prompt, request_options=None):
+        self.model.sent.append(prompt)
+        if "SLOW" in prompt:
+            self.model.release.wait(5)
+        if self.model.fail_sends:
+            raise RuntimeError("backend down")
+        reply = f"reply to {prompt.strip()[:20]}"
+        self.history += [
+            SimpleNamespace(role="user", parts=[SimpleNamespace(text=prompt)]),
+            SimpleNamespace(role="model", parts=[SimpleNamespace(text=reply)]),
+        ]
+        return SimpleNamespace(text=reply, usage_metadata=None)
+
+
+class StubModel:
+    def __init__(self):
+        self.sent = []
+        self.release = threading.Event()
+        self.fail_sends = False
+        self.decision = "NO - general question"
+
+    def start_chat(self, history):
+        return StubChat(self, history)
+
+    def generate_content(self, prompt, request_options=None):
+        return SimpleNamespace(text=self.decision, usage_metadata=None)
+
+
+@pytest.fixture
+def agent():
+    agent = ResearchAgent("test-key", model=StubModel())
+    # Keep tests independent of the process-wide breakers
+    agent.gemini_breaker = CircuitBreaker("gemini-test")
+    agent.search_breaker = CircuitBreaker("search-test")
+    return agent
+
+
+def _texts(history):
+    return [part.text for content in history for part in content.parts]
+
+
+def test_send_records_good_history(agent):
+    agent._send("hello", "generation", 1)
+
+    assert len(agent._good_history) == 2
+    assert _texts(agent.chat.history) == _texts(agent._good_history)
+
+
+def test_timed_out_generation_never_lands_in_history(agent):
+    agent._send("first", "generation", 1)
+    text, status, _, _ = agent.get_response("SLOW question", deadline=0.3)
+
+    assert "couldn't finish" in text
+    # The abandoned send completes later on the old chat
+    agent.model.release.set()
+    time.sleep(0.2)
+    assert not any("SLOW" in t for t in _texts(agent._good_history))
+    assert not any("SLOW" in t for t in _texts(agent.chat.history))
+
+    # The next turn continues from the last known-good history
+    agent.get_response("next question")
+    assert any("first" in t for t in _texts(agent.chat.history))
+    assert not any("SLOW" in t for t in _texts(agent.chat.history))
+
+
+def test_send_while_previous_still_running_uses_fresh_chat(agent):
+    agent._send("first", "generation", 1)
+    worker = threading.Thread(target=agent._send, args=("SLOW pending", "generation", 1))
+    worker.start()
+    time.sleep(0.1)
+
+    agent._send("second", "generation", 2)
+    agent.model.release.set()
+    worker.join()
+
+    texts = _texts(agent._good_history)
+    assert any("second" in t for t in texts)
+    assert not any("SLOW" in t for t in texts)
+
+
+def test_failed_persona_send_backs_off(agent):
+    agent.model.fail_sends = True
+    agent.update_persona("be brief", "Brief")
+    attempts = len(agent.model.sent)
+    assert attempts > 0
+
+    # A rerun right after a failure does not call the model again
+    agent.update_persona("be brief", "Brief")
+    assert len(agent.model.sent) == attempts
+    assert agent.current_persona == "Brief"
+
+    # Once the back-off has passed it retries
+    agent.model.fail_sends = False
+    agent._persona_failed_at -= agent.PERSONA_RETRY_AFTER
+    agent.update_persona("be brief", "Brief")
+    assert agent._applied_persona_prompt == "be brief"
+
+
+class StubPrefetcher:
+    def __init__(self, data):
+        self.data = data
+
+    def get_warm_data(self, user_input):
+        return self.data
+
+
+def test_fresh_watchlist_data_skips_live_search(agent, monkeypatch):
+    agent.model.decision = "YES - needs company news"
+    searches = []
+    monkeypatch.setattr(agent, "_search", lambda *args: searches.append(args) or "live results")
+    monkeypatch.setattr("utils.agent.get_prefetcher", lambda: StubPrefetcher("Acme warm data"))
+
+    _, status, context, _ = agent.get_response("latest on Acme")
+
+    assert searches == []
+    assert "[WATCHLIST DATA]" in context and "Acme warm data" in context
+    # Query generation is skipped along with the search
+    assert not any(s.startswith("📝") for s in status)
+
+
+def test_live_search_runs_without_warm_data(agent, monkeypatch):
+    agent.model.decision = "YES - needs company news"
+    monkeypatch.setattr(agent, "_search", lambda *args: "live results")
+    monkeypatch.setattr("utils.agent.get_prefetcher", lambda: StubPrefetcher(None))
+
+    _, _, context, _ = agent.get_response("latest on Initech")
+
+    assert "[LIVE SEARCH RESULTS]" in context
+
+
+def test_timed_out_generation_is_still_recorded(agent):
+    agent._send("first", "generation")
+    agent.get_response("SLOW question", deadline=0.3)
+    calls = list(agent.usage.calls)
+    agent.model.release.set()
+
+    [timed_out] = [c for c in calls if c['turn'] == agent.usage.turn and c['stage'] == "generation"]
+    assert timed_out['source'] == "estimate"
+    assert timed_out['output_tokens'] == 0
+    # The estimate covers the history sent along with the prompt
+    assert timed_out['prompt_tokens'] > estimate_tokens("SLOW question")
+
+
+def test_trim_history_keeps_latest_exchanges(agent):
+    for i in range(5):
+        agent._send(f"question {i} " + "x" * 80, "generation", 1)
+    agent._applied_persona_prompt = "be brief"
+
+    agent._trim_history(60)
+
+    texts = _texts(agent._good_history)
+    assert len(texts) == 2 and "question 4" in texts[0]
+    assert _texts(agent.chat.history) == texts
+    assert agent._history_tokens == agent._estimate_history_tokens(agent._good_history)
+    # The persona may have been trimmed away, so it is re-sent on the next rerun
+    assert agent._applied_persona_prompt is None
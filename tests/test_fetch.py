@@ -0,0 +1,136 @@
+# [file name]: test_fetch.py
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+
+from utils import fetch
+
+PAGE = (
+    "<html><head><title>Acme Results</title><script>var x = 1;</script></head><body>"
+    "<nav>Home About</nav>"
+    "<p>Acme reported annual revenue of €310 million, up 12% compared with the previous year.</p>"
+    "<p>Short line</p>"
+    "</body></html>"
+).encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _start(self, content_type="text/html"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path == "/page":
+            # No charset in the header: must not fall back to ISO-8859-1
+            self._start()
+            self.wfile.write(PAGE)
+        elif self.path == "/big":
+            self._start()
+            self.wfile.write(b"<p>" + b"word " * 400_000 + b"</p>")
+        elif self.path == "/slow":
+            self._start()
+            try:
+                for _ in range(50):
+                    self.wfile.write(b"<p>still loading the page content for this slow handler</p>")
+                    self.wfile.flush()
+                    time.sleep(0.2)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        elif self.path.startswith("/count"):
+            cls = type(self)
+            with cls.lock:
+                cls.active += 1
+                cls.max_active = max(cls.max_active, cls.active)
+            time.sleep(0.3)
+            with cls.lock:
+                cls.active -= 1
+            self._start()
+            self.wfile.write(PAGE)
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_extracts_text_and_figures(server):
+    [page] = fetch.deep_fetch([f"{server}/page"], total_timeout=5)
+
+    assert page["ok"]
+    assert page["title"] == "Acme Results"
+    assert "var x" not in page["text"]
+    assert "Home About" not in page["text"]
+    assert page["figures"] == [
+        "Acme reported annual revenue of €310 million, up 12% compared with the previous year."
+    ]
+    assert page["bytes"] == len(PAGE)
+
+
+def test_size_cap(server):
+    [page] = fetch.deep_fetch([f"{server}/big"], max_bytes=50_000, total_timeout=5)
+
+    assert page["ok"]
+    assert page["bytes"] >= 50_000
+    assert page["bytes"] < 50_000 + 16384
+
+
+def test_total_deadline_with_slow_handler(server):
+    start = time.monotonic()
+    [page] = fetch.deep_fetch([f"{server}/slow"], total_timeout=1, timeout=5)
+
+    assert time.monotonic() - start < 2
+    assert page["elapsed"] <= 1.5
+
+    # The abandoned fetch stops at the deadline and gives its domain slot back
+    time.sleep(0.5)
+    assert not fetch._domain_active
+
+
+def test_domain_limit_is_shared_across_callers(server):
+    _Handler.max_active = 0
+    results = []
+
+    def run(limit):
+        results.extend(fetch.deep_fetch([f"{server}/count?{limit}-{i}" for i in range(2)], top_k=2,
+                                        per_domain_limit=limit, total_timeout=5))
+
+    threads = [threading.Thread(target=run, args=(limit,)) for limit in (1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(page["ok"] for page in results)
+    # Never more than the largest limit in use, not the sum of both
+    assert _Handler.max_active <= 2
+
+
+def test_per_domain_limit(server):
+    _Handler.max_active = 0
+    urls = [f"{server}/count?{i}" for i in range(4)]
+    pages = fetch.deep_fetch(urls, top_k=4, per_domain_limit=1, total_timeout=5)
+
+    assert all(page["ok"] for page in pages)
+    assert _Handler.max_active == 1
+
+
+def test_meta_charset_is_used():
+    body = '<html><head><meta charset="utf-8"></head><body>€</body></html>'.encode("utf-8")
+    assert fetch._detect_encoding("text/html", body) == "utf-8"
+    assert fetch._detect_encoding("text/html; charset=iso-8859-1", body) == "iso-8859-1"
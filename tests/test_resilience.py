@@ -0,0 +1,112 @@
+# [file name]: test_resilience.py
+import threading
+import time
+
+import pytest
+
+from utils.resilience import TurnBudget, CircuitBreaker, StageTimeout, CircuitOpen
+
+WEIGHTS = {"decision": 0.1, "query": 0.1, "search": 0.3, "generation": 0.5}
+FLOORS = {"decision": 10, "query": 10, "search": 8, "generation": 20}
+
+
+def _fail():
+    raise RuntimeError("backend down")
+
+
+def test_budget_splits_by_weight():
+    budget = TurnBudget(100, WEIGHTS)
+    assert budget.stage_timeout("decision") == pytest.approx(10, abs=0.1)
+    assert budget.stage_timeout("generation") == pytest.approx(100, abs=0.1)
+
+
+def test_unused_time_rolls_forward():
+    budget = TurnBudget(10, {"a": 1, "b": 1})
+    # Nothing spent on "a", so "b" may use everything left
+    assert budget.stage_timeout("a") == pytest.approx(5, abs=0.1)
+    assert budget.stage_timeout("b") == pytest.approx(10, abs=0.1)
+
+
+def test_floors_apply_when_deadline_allows():
+    budget = TurnBudget(60, WEIGHTS, FLOORS)
+    assert budget.stage_timeout("decision") == pytest.approx(10, abs=0.1)
+
+
+def test_floors_scale_down_and_keep_later_stages_share():
+    budget = TurnBudget(24, WEIGHTS, FLOORS)
+    # Floors add up to 48s, twice the deadline, so each is halved
+    decision = budget.stage_timeout("decision")
+    assert decision == pytest.approx(5, abs=0.1)
+    # Even if decision uses all of its time, generation keeps its scaled floor
+    budget.deadline -= decision
+    budget.deadline -= budget.stage_timeout("query")
+    budget.deadline -= budget.stage_timeout("search")
+    assert budget.stage_timeout("generation") >= 10 - 0.1
+
+
+def test_breaker_opens_after_threshold_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(_fail, 1)
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.call(lambda: "ok", 1)
+
+
+def test_short_timeouts_do_not_open_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, slow_call_timeout=8)
+    with pytest.raises(StageTimeout):
+        breaker.call(time.sleep, 0.05, 1)
+    assert breaker.state == "closed"
+
+
+def test_hung_backend_opens_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=2, slow_call_timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(StageTimeout):
+            breaker.call(time.sleep, 0.05, 1)
+    assert breaker.state == "open"
+
+
+def test_half_open_lets_single_trial_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.1)
+    with pytest.raises(RuntimeError):
+        breaker.call(_fail, 1)
+    time.sleep(0.15)
+    assert breaker.state == "half-open"
+
+    calls = []
+    outcomes = []
+
+    def slow_fail():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError("still down")
+
+    def caller():
+        try:
+            breaker.call(slow_fail, 1)
+        except Exception as e:
+            outcomes.append(type(e).__name__)
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(outcomes) == ["CircuitOpen"] * 4 + ["RuntimeError"]
+    assert breaker.state == "open"
+
+
+def test_successful_trial_closes_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    with pytest.raises(RuntimeError):
+        breaker.call(_fail, 1)
+    time.sleep(0.1)
+
+    assert breaker.call(lambda: "ok", 1) == "ok"
+    assert breaker.state == "closed"
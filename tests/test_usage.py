@@ -0,0 +1,89 @@
+# [file name]: test_usage.py
+from types import SimpleNamespace
+
+from utils.usage import UsageTracker, BudgetGovernor, PendingCall, usage_from_response, estimate_tokens
+
+
+def _response(**counts):
+    return SimpleNamespace(text="answer", usage_metadata=SimpleNamespace(**counts))
+
+
+def test_thinking_tokens_count_as_output():
+    response = _response(prompt_token_count=100, candidates_token_count=50, thoughts_token_count=400,
+                         total_token_count=550)
+    assert usage_from_response(response, "prompt") == (100, 450, "sdk")
+
+    # Older responses without a total still add the thoughts
+    response = _response(prompt_token_count=100, candidates_token_count=50, thoughts_token_count=400)
+    assert usage_from_response(response, "prompt") == (100, 450, "sdk")
+
+
+def test_estimates_without_metadata():
+    response = SimpleNamespace(text="x" * 40, usage_metadata=None)
+    assert usage_from_response(response, "y" * 400) == (100, 10, "estimate")
+
+
+def test_calls_outside_a_turn_are_session_overhead():
+    tracker = UsageTracker()
+    tracker.record("persona", "Brief", 100, 10, "sdk")
+    turn = tracker.start_turn()
+    tracker.record("generation", "Brief", 200, 20, "sdk", turn)
+
+    assert tracker.turn_tokens(turn) == 220
+    assert tracker.turn_tokens(UsageTracker.SESSION_OVERHEAD) == 110
+    assert tracker.session_tokens() == 330
+
+
+def test_abandoned_call_records_prompt_estimate_once():
+    tracker = UsageTracker()
+    call = PendingCall(tracker, "generation", "Brief", 1, prompt_estimate=estimate_tokens("x" * 400))
+    call.start()
+    call.abandon()
+    assert tracker.turn_tokens(1) == 100
+
+    # The late reply only adds its output
+    call.complete(120, 30, "sdk")
+    assert tracker.turn_tokens(1) == 130
+    assert [c['source'] for c in tracker.calls] == ["estimate", "sdk"]
+
+
+def test_completed_call_is_not_abandoned():
+    tracker = UsageTracker()
+    call = PendingCall(tracker, "decision", "Brief", 1, prompt_estimate=100)
+    call.start()
+    call.complete(80, 5, "sdk")
+    call.abandon()
+    assert tracker.turn_tokens(1) == 85
+
+
+def test_call_that_never_started_is_not_recorded():
+    tracker = UsageTracker()
+    PendingCall(tracker, "query", "Brief", 1, prompt_estimate=100).abandon()
+    assert tracker.calls == []
+
+
+def test_plan_turn_modes():
+    governor = BudgetGovernor(max_turn_tokens=1000, max_session_tokens=5000, output_reserve=200)
+    tracker = UsageTracker()
+    assert governor.plan_turn(tracker) == "full"
+
+    tracker.record("generation", "Brief", 4200, 0, "sdk", 1)
+    assert governor.plan_turn(tracker) == "lean"
+
+    tracker.record("generation", "Brief", 700, 0, "sdk", 2)
+    assert governor.plan_turn(tracker) == "refuse"
+
+
+def test_prompt_budget_uses_tightest_limit():
+    governor = BudgetGovernor(max_turn_tokens=1000, max_session_tokens=5000, output_reserve=200)
+    tracker = UsageTracker()
+    turn = tracker.start_turn()
+    tracker.record("decision", "Brief", 300, 0, "sdk", turn)
+    assert governor.prompt_budget(tracker, turn) == 500
+
+    tracker.record("generation", "Brief", 4500, 0, "sdk", 0)
+    # Session limit now tighter than the turn limit
+    assert governor.prompt_budget(tracker, turn) == 0
+    assert not governor.allow_optional(tracker, turn)
+
+    assert BudgetGovernor(None, None).prompt_budget(tracker, turn) is None
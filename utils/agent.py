@@ -1,19 +1,63 @@
 # [file name]: agent.py
-import google.generativeai as genai
-from utils.tools import search_web
+from utils.lazy import lazy_import
+from utils.tools import search_web, get_cached_search
+from utils.prefetch import get_prefetcher, interactive_turn
+from utils.resilience import TurnBudget, StageTimeout, CircuitOpen, get_breaker
+from utils.usage import (UsageTracker, BudgetGovernor, PendingCall, usage_from_response, estimate_tokens,
+                         fit_to_budget)
+from urllib.parse import urlparse
+import threading
+import time
 import re
 
 
+def create_model(api_key):
+    """
+    Configure the Gemini SDK (imported on first use) and build the model client.
+    The key is set with genai.configure, which applies to the whole process.
+    """
+    genai = lazy_import("google.generativeai")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel('gemini-2.5-flash')
+
+
 class ResearchAgent:
-    def __init__(self, api_key):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+    # Share of the turn deadline each stage may use
+    STAGE_WEIGHTS = {"decision": 0.1, "query": 0.1, "search": 0.3, "generation": 0.5}
+    # gemini-2.5-flash thinks before answering, so even short prompts need several seconds
+    MIN_STAGE_TIMEOUTS = {"decision": 10, "query": 10, "search": 8, "generation": 20}
+    PERSONA_TIMEOUT = 15
+    # After a failed persona send, reruns skip it for this long instead of blocking the sidebar again
+    PERSONA_RETRY_AFTER = 60
+
+    def __init__(self, api_key, deep_fetch=False, turn_deadline=60, max_turn_tokens=20000,
+                 max_session_tokens=500000, model=None):
+        # A shared model client can be passed in; chat history stays per agent
+        self.model = model or create_model(api_key)
         self.chat = self.model.start_chat(history=[])
+        # History as of the last send that completed on the current chat, and its size in tokens
+        self._good_history = []
+        self._history_tokens = 0
+        self._chat_busy = False
+        self._chat_lock = threading.Lock()
         self.current_persona = "Standard Professional"
+        self._applied_persona_prompt = None
+        self._persona_failed_at = None
+        self.deep_fetch = deep_fetch
+        self.turn_deadline = turn_deadline
+        self.gemini_breaker = get_breaker("gemini")
+        self.search_breaker = get_breaker("search")
+        self.usage = UsageTracker()
+        self.governor = BudgetGovernor(max_turn_tokens, max_session_tokens)
 
     def update_persona(self, persona_prompt, persona_name):
         """Injects the selected persona into the system context."""
+        # Streamlit calls this on every rerun; only message the model when the persona changes
+        if persona_prompt == self._applied_persona_prompt:
+            return
         self.current_persona = persona_name
+        if self._persona_failed_at and time.monotonic() - self._persona_failed_at < self.PERSONA_RETRY_AFTER:
+            return
         system_message = f"""
         SYSTEM UPDATE: Adopt the following persona guidelines strictly: {persona_prompt}
 
@@ -24,12 +68,27 @@ class ResearchAgent:
         4. Structure account plans with clear sections
         5. Adapt your response style to the selected persona
         """
+        timeout = self.PERSONA_TIMEOUT
         try:
-            self.chat.send_message(system_message)
-        except:
+            self._model_call(self._send, timeout, system_message, "persona")
+        except (StageTimeout, CircuitOpen) as e:
+            # Don't block the rerun; the persona is retried on the next one
+            print(f"Persona update skipped: {e}")
+            self._reset_chat()
+            self._persona_failed_at = time.monotonic()
+            return
+        except Exception:
             # If history is too long, restart chat
-            self.chat = self.model.start_chat(history=[])
-            self.chat.send_message(system_message)
+            self._reset_chat(history=[])
+            try:
+                self._model_call(self._send, timeout, system_message, "persona")
+            except Exception as e:
+                print(f"Persona update failed: {e}")
+                self._reset_chat()
+                self._persona_failed_at = time.monotonic()
+                return
+        self._applied_persona_prompt = persona_prompt
+        self._persona_failed_at = None
 
     def _extract_account_plan(self, text):
         """Extract account plan sections from response."""
@@ -57,9 +116,184 @@ class ResearchAgent:
 
         return plan_sections
 
-    def get_response(self, user_input, current_plan_context=""):
+    def _record_usage(self, response, prompt, stage, turn, call=None, history_tokens=0):
+        prompt_tokens, output_tokens, source = usage_from_response(response, prompt)
+        # The SDK's prompt count already includes the history sent with a chat message;
+        # the local estimate has to add it
+        if source == "estimate":
+            prompt_tokens += history_tokens
+        if call:
+            call.complete(prompt_tokens, output_tokens, source)
+        else:
+            self.usage.record(stage, self.current_persona, prompt_tokens, output_tokens, source, turn)
+        return prompt_tokens, output_tokens
+
+    def _model_call(self, func, timeout, prompt, stage, turn=None):
+        """
+        Run _generate or _send through the Gemini breaker. A call abandoned at the
+        stage deadline is still billed, so it is recorded as a prompt-only estimate.
+        """
+        call = PendingCall(self.usage, stage, self.current_persona, turn, estimate_tokens(prompt))
+        try:
+            return self.gemini_breaker.call(func, timeout, prompt, stage, turn, timeout, call)
+        except StageTimeout:
+            call.abandon()
+            raise
+
+    def _call_model(self, func, prompt, timeout):
+        """
+        Pass the stage timeout to the SDK so an overrunning request really ends
+        instead of lingering in the stage pool.
+        """
+        try:
+            if timeout:
+                return func(prompt, request_options={"timeout": timeout})
+            return func(prompt)
+        except Exception as e:
+            if isinstance(e, TimeoutError) or type(e).__name__ in ("DeadlineExceeded", "ReadTimeout"):
+                raise StageTimeout(f"Model call exceeded {timeout:.1f}s") from e
+            raise
+
+    def _generate(self, prompt, stage, turn=None, timeout=None, call=None):
+        """Single stateless model call."""
+        if call:
+            call.start()
+        response = self._call_model(self.model.generate_content, prompt, timeout)
+        self._record_usage(response, prompt, stage, turn, call)
+        return response.text.strip()
+
+    def _reset_chat(self, history=None):
+        """
+        Continue on a fresh chat from the last known-good history.
+        An abandoned send still running on the old chat can then no longer
+        add an exchange the user never saw, or race the next turn's send.
+        """
+        with self._chat_lock:
+            if history is not None:
+                self._good_history = list(history)
+                self._history_tokens = self._estimate_history_tokens(self._good_history)
+            self.chat = self.model.start_chat(history=list(self._good_history))
+            self._chat_busy = False
+
+    def _send(self, prompt, stage, turn=None, timeout=None, call=None):
+        """Chat call that keeps conversation history."""
+        with self._chat_lock:
+            if self._chat_busy:
+                # A previous send on this chat is still running; don't share its history
+                self.chat = self.model.start_chat(history=list(self._good_history))
+            chat = self.chat
+            self._chat_busy = True
+            history_tokens = self._history_tokens
+        if call:
+            call.start(history_tokens)
+
+        completed = False
+        try:
+            response = self._call_model(chat.send_message, prompt, timeout)
+            completed = True
+        finally:
+            with self._chat_lock:
+                if chat is self.chat:
+                    self._chat_busy = False
+                    if completed:
+                        self._good_history = list(chat.history)
+
+        prompt_tokens, output_tokens = self._record_usage(response, prompt, stage, turn, call, history_tokens)
+        with self._chat_lock:
+            if chat is self.chat:
+                self._history_tokens = prompt_tokens + output_tokens
+        return response
+
+    @staticmethod
+    def _estimate_history_tokens(history):
+        return sum(estimate_tokens(getattr(part, 'text', '') or '')
+                   for content in history for part in getattr(content, 'parts', []))
+
+    def _trim_history(self, max_tokens):
+        """Keep only the most recent exchanges of the chat history that fit in max_tokens."""
+        kept = []
+        used = 0
+        # Walk back one user/model exchange at a time
+        history = list(self._good_history)
+        for i in range(len(history) - 2, -1, -2):
+            exchange = history[i:i + 2]
+            size = self._estimate_history_tokens(exchange)
+            if used + size > max_tokens:
+                break
+            kept = exchange + kept
+            used += size
+        self._reset_chat(history=kept)
+        # The persona instructions may have been dropped; re-send them on the next rerun
+        self._applied_persona_prompt = None
+
+    def _search(self, search_query, deep_fetch, fetch_stats=None):
+        """Run the web search, treating an unavailable backend as a failure."""
+        raw_data = search_web(search_query, deep_fetch=deep_fetch, fetch_stats=fetch_stats)
+        if raw_data.startswith("Search unavailable"):
+            raise RuntimeError(raw_data)
+        return raw_data
+
+    @staticmethod
+    def _format_fetch_stats(fetch_stats):
+        """One status line with bytes and time for each fetched page."""
+        pages = []
+        for page in fetch_stats:
+            host = urlparse(page['url']).netloc or page['url']
+            outcome = f"{page['bytes'] / 1024:.0f} KB" if page['ok'] else (page['error'] or "failed")
+            pages.append(f"{host} {outcome} in {page['elapsed']:.1f}s")
+        return "📥 Pages read: " + "; ".join(pages)
+
+    def _build_prompt(self, user_input, current_plan_context, search_context):
+        """Final generation prompt."""
+        return f"""
+        PERSONA: {self.current_persona}
+        CURRENT ACCOUNT PLAN CONTEXT:
+        {current_plan_context}
+
+        USER REQUEST: {user_input}
+
+        {search_context}
+
+        INSTRUCTIONS:
+        1. First, acknowledge the request and mention if you're using search data
+        2. Provide status updates on your findings ("I'm noticing conflicting information about...")
+        3. If updating the account plan, structure it clearly with headers (## Section Name)
+        4. Ask clarifying questions when needed
+        5. Adapt to the persona style
+        6. End with a natural conversational closing
+
+        Important sections for account plans:
+        ## Company Overview
+        ## Key Financials  
+        ## Market Position
+        ## Growth Opportunities
+        ## Strategic Recommendations
+        """
+
+    def get_response(self, user_input, current_plan_context="", deadline=None):
+        """
+        Run one turn within `deadline` seconds (defaults to self.turn_deadline).
+        Overrunning stages are abandoned: the decision defaults to NO, search falls back
+        to cached results or none, and generation returns a partial answer.
+        """
+        # Background watchlist refreshes hold off while a turn is running
+        with interactive_turn():
+            return self._respond(user_input, current_plan_context, deadline)
+
+    def _respond(self, user_input, current_plan_context, deadline):
         status_updates = []
         search_context = ""
+        raw_data = ""
+        budget = TurnBudget(deadline or self.turn_deadline, self.STAGE_WEIGHTS, self.MIN_STAGE_TIMEOUTS)
+        turn = self.usage.start_turn()
+
+        # 0. GOVERNOR: Check the session token budget
+        mode = self.governor.plan_turn(self.usage)
+        if mode == "refuse":
+            return ("This session has used its token budget. Please start a new session to continue researching.",
+                    ["🛑 Session token budget exhausted"], "", {})
+        if mode == "lean":
+            status_updates.append("🪫 Token budget running low, using a lighter research path")
 
         # 1. DECISION: Check if search is needed with reasoning
         decision_prompt = f"""
@@ -78,15 +312,29 @@ class ResearchAgent:
         """
 
         try:
-            decision_response = self.model.generate_content(decision_prompt).text.strip()
+            timeout = budget.stage_timeout("decision")
+            decision_response = self._model_call(self._generate, timeout, decision_prompt, "decision", turn)
             decision = "YES" if decision_response.startswith("YES") else "NO"
             status_updates.append(f"🔍 Analysis: {decision_response}")
+        except StageTimeout:
+            decision = "NO"
+            status_updates.append("⏱️ Decision analysis timed out, defaulting to NO")
         except Exception as e:
             decision = "NO"
             status_updates.append(f"⚠️ Decision analysis failed, defaulting to NO")
 
-        # 2. ACTION: Search if needed
-        if "YES" in decision:
+        # 2. ACTION: Search if needed; fresh watchlist data stands in for the live search,
+        # which stays the fallback for companies that aren't watched or have gone stale
+        warm_data = get_prefetcher().get_warm_data(user_input) if "YES" in decision else None
+        if warm_data:
+            raw_data = warm_data
+            search_context = f"\n[WATCHLIST DATA]:\n{warm_data}\n"
+            status_updates.append("🗂️ Using recently refreshed watchlist data (skipping live search)")
+
+        elif "YES" in decision and not self.governor.allow_optional(self.usage, turn):
+            status_updates.append("🪫 Skipping search to stay within the token budget")
+
+        elif "YES" in decision:
             status_updates.append("🕵️ Researching live data...")
 
             # Generate search query
@@ -101,54 +349,87 @@ class ResearchAgent:
             - Recent developments, market analysis
             """
 
-            try:
-                search_query = self.model.generate_content(query_prompt).text.strip()
-                status_updates.append(f"📝 Search query: {search_query}")
+            # Query generation is optional; in lean mode search with the user's wording
+            search_query = user_input
+            if mode == "full":
+                try:
+                    timeout = budget.stage_timeout("query")
+                    search_query = self._model_call(self._generate, timeout, query_prompt, "query", turn)
+                except Exception as e:
+                    # Fall back to the raw user input as the query
+                    status_updates.append("⚠️ Query generation unavailable, searching with your wording")
+            status_updates.append(f"📝 Search query: {search_query}")
 
-                # Perform search
-                raw_data = search_web(search_query)
+            try:
+                # Perform search; full-page fetches add a lot of prompt tokens, so skip them in lean mode
+                deep_fetch = self.deep_fetch and mode == "full"
+                if deep_fetch:
+                    status_updates.append("📚 Reading full pages of top results...")
+                fetch_stats = []
+                raw_data = self.search_breaker.call(self._search, budget.stage_timeout("search"), search_query,
+                                                    deep_fetch, fetch_stats)
                 search_context = f"\n[LIVE SEARCH RESULTS]:\n{raw_data}\n"
+                if fetch_stats:
+                    status_updates.append(self._format_fetch_stats(fetch_stats))
                 status_updates.append("✅ Search completed, analyzing results...")
 
             except Exception as e:
-                search_context = f"\n[SEARCH ERROR]: {str(e)}\n"
-                status_updates.append("❌ Search failed, proceeding without live data")
+                cached = get_cached_search(search_query)
+                if isinstance(e, StageTimeout):
+                    status_updates.append("⏱️ Search timed out")
+                elif isinstance(e, CircuitOpen):
+                    status_updates.append("⚡ Search temporarily disabled after repeated failures")
 
-        # 3. Generate thoughtful response
-        full_prompt = f"""
-        PERSONA: {self.current_persona}
-        CURRENT ACCOUNT PLAN CONTEXT:
-        {current_plan_context}
-
-        USER REQUEST: {user_input}
-
-        {search_context}
+                if cached:
+                    raw_data = cached
+                    search_context = f"\n[CACHED SEARCH RESULTS]:\n{cached}\n"
+                    status_updates.append("🗂️ Using cached search results")
+                else:
+                    search_context = f"\n[SEARCH ERROR]: {str(e)}\n"
+                    status_updates.append("❌ Search failed, proceeding without live data")
 
-        INSTRUCTIONS:
-        1. First, acknowledge the request and mention if you're using search data
-        2. Provide status updates on your findings ("I'm noticing conflicting information about...")
-        3. If updating the account plan, structure it clearly with headers (## Section Name)
-        4. Ask clarifying questions when needed
-        5. Adapt to the persona style
-        6. End with a natural conversational closing
+        # 3. Generate thoughtful response, trimming context to the remaining token budget
+        # The chat call also sends the whole history, so it counts against the budget too
+        prompt_budget = self.governor.prompt_budget(self.usage, turn)
+        if prompt_budget is not None:
+            if self._history_tokens > prompt_budget // 2:
+                self._trim_history(prompt_budget // 2)
+                status_updates.append("✂️ Trimmed older conversation history to fit the token budget")
+            available = (prompt_budget - estimate_tokens(self._build_prompt(user_input, "", ""))
+                         - self._history_tokens)
+            if estimate_tokens(current_plan_context) + estimate_tokens(search_context) > available:
+                plan_share = min(estimate_tokens(current_plan_context), available // 2)
+                search_context = fit_to_budget(search_context, available - plan_share)
+                current_plan_context = fit_to_budget(current_plan_context,
+                                                     available - estimate_tokens(search_context))
+                status_updates.append("✂️ Trimmed context to fit the token budget")
 
-        Important sections for account plans:
-        ## Company Overview
-        ## Key Financials  
-        ## Market Position
-        ## Growth Opportunities
-        ## Strategic Recommendations
-        """
+        full_prompt = self._build_prompt(user_input, current_plan_context, search_context)
 
         try:
-            response = self.chat.send_message(full_prompt)
+            timeout = budget.stage_timeout("generation")
+            response = self._model_call(self._send, timeout, full_prompt, "generation", turn)
             response_text = response.text
+            status_updates.append(f"🧮 Tokens this turn: {self.usage.turn_tokens(turn):,} "
+                                  f"(session: {self.usage.session_tokens():,})")
 
             # Extract account plan updates
             plan_updates = self._extract_account_plan(response_text)
 
             return response_text, status_updates, search_context, plan_updates
 
+        except (StageTimeout, CircuitOpen) as e:
+            # Drop the abandoned exchange so it can't land in history later
+            self._reset_chat()
+            # Partial answer: hand back whatever research we already have
+            status_updates.append(f"⏱️ Response generation stopped: {str(e)}")
+            if raw_data:
+                partial = ("I couldn't finish a full analysis in time, but here is what I found so far:\n\n"
+                           f"{raw_data}\n\nAsk me again to get the complete write-up.")
+            else:
+                partial = "I couldn't finish this answer in time. Please try again in a moment."
+            return partial, status_updates, search_context, {}
+
         except Exception as e:
             error_msg = f"I apologize, but I encountered an error: {str(e)}. Please try rephrasing your question."
             return error_msg, ["❌ Error generating response"], "", {}
\ No newline at end of file
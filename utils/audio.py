@@ -1,5 +1,5 @@
 # [file name]: audio.py
-import pyttsx3
+from utils.lazy import lazy_import
 import os
 import threading
 import re
@@ -9,16 +9,28 @@ import time
 
 class AudioManager:
     def __init__(self):
+        # The engine and playback thread are started on first use, so sessions
+        # with audio turned off never load pyttsx3
         self.engine = None
         self.audio_queue = queue.Queue()
         self.is_playing = False
-        self._initialize_engine()
-        self._start_audio_worker()
+        self.audio_thread = None
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Initialize the engine and worker thread on first use."""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            self._initialize_engine()
+            self._start_audio_worker()
 
     def _initialize_engine(self):
         """Initialize the TTS engine once."""
         try:
-            self.engine = pyttsx3.init()
+            self.engine = lazy_import("pyttsx3").init()
 
             # Improved voice settings
             voices = self.engine.getProperty('voices')
@@ -73,7 +85,11 @@ class AudioManager:
         Convert text to audio file and optionally queue for playback.
         Returns audio bytes for Streamlit.
         """
-        if not text or not self.engine:
+        if not text:
+            return None
+
+        self._ensure_started()
+        if not self.engine:
             return None
 
         output_file = "response_audio.mp3"
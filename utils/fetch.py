@@ -0,0 +1,284 @@
+# [file name]: fetch.py
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+import threading
+import codecs
+import time
+import re
+
+
+# Tags whose text never belongs to the main article body
+_SKIP_TAGS = {'script', 'style', 'noscript', 'nav', 'footer', 'header', 'aside', 'form', 'svg', 'iframe'}
+_BLOCK_TAGS = {'p', 'li', 'h1', 'h2', 'h3', 'h4', 'td', 'th', 'blockquote', 'article', 'section', 'div', 'br'}
+
+# Money amounts, percentages and growth figures that matter for account plans
+_FIGURE_PATTERNS = [
+    r'[$€£¥]\s?\d[\d,]*(?:\.\d+)?\s?(?:trillion|billion|million|thousand|[TBMK]n?)?\b',
+    r'\b\d[\d,]*(?:\.\d+)?\s?(?:trillion|billion|million)\s(?:dollars|USD|EUR|euros)?',
+    r'\b\d+(?:\.\d+)?\s?%',
+]
+
+_session = None
+_session_lock = threading.Lock()
+# In-flight requests per host, shared by every caller whatever limit it asks for
+_domain_active = {}
+_domain_slots = threading.Condition()
+
+
+class _TextExtractor(HTMLParser):
+    """Collect visible text blocks from an HTML page."""
+
+    def __init__(self):
+        super().__init__()
+        self.blocks = []
+        self.title = ""
+        self._current = []
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == 'title':
+            self._in_title = True
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == 'title':
+            self._in_title = False
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self._current.append(data)
+
+    def _flush(self):
+        text = re.sub(r'\s+', ' ', ''.join(self._current)).strip()
+        if text:
+            self.blocks.append(text)
+        self._current = []
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def get_session(pool_size=10):
+    """Get the shared pooled HTTP session."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session.headers.update({
+                'User-Agent': 'Mozilla/5.0 (compatible; ResearchAgent/1.0)',
+                'Accept': 'text/html,application/xhtml+xml;q=0.9,text/plain;q=0.8',
+            })
+    return _session
+
+
+def _acquire_domain_slot(domain, per_domain_limit, timeout):
+    """
+    Wait until fewer than `per_domain_limit` requests are in flight to this host.
+    The count is per host only, so callers with different limits still share it
+    and a host never sees more than the largest limit in use.
+    """
+    with _domain_slots:
+        acquired = _domain_slots.wait_for(lambda: _domain_active.get(domain, 0) < per_domain_limit,
+                                          timeout=timeout)
+        if acquired:
+            _domain_active[domain] = _domain_active.get(domain, 0) + 1
+        return acquired
+
+
+def _release_domain_slot(domain):
+    with _domain_slots:
+        _domain_active[domain] -= 1
+        if not _domain_active[domain]:
+            del _domain_active[domain]
+        _domain_slots.notify_all()
+
+
+def _detect_encoding(content_type, body):
+    """
+    Charset from the Content-Type header, then <meta charset>, then UTF-8.
+    requests falls back to ISO-8859-1 for text/* without a charset, which garbles UTF-8 pages.
+    """
+    match = re.search(r'charset=["\']?([\w.:-]+)', content_type, re.IGNORECASE)
+    if not match:
+        match = re.search(rb'<meta[^>]+charset=["\']?([\w.:-]+)', body[:4096], re.IGNORECASE)
+    encoding = match.group(1) if match else 'utf-8'
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode('ascii', errors='ignore')
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        encoding = 'utf-8'
+    return encoding
+
+
+def extract_main_text(html, max_chars=3000):
+    """
+    Extract the title and main readable text from an HTML page
+    """
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+
+    # Short fragments are usually menus, buttons and cookie banners
+    blocks = [block for block in parser.blocks if len(block.split()) >= 8]
+    if not blocks:
+        blocks = parser.blocks
+
+    text = "\n".join(blocks)
+    return parser.title.strip(), text[:max_chars]
+
+
+def extract_key_figures(text, max_figures=8):
+    """
+    Pull sentences containing financial figures out of extracted text
+    """
+    figures = []
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    for sentence in sentences:
+        if any(re.search(pattern, sentence, re.IGNORECASE) for pattern in _FIGURE_PATTERNS):
+            sentence = sentence.strip()[:200]
+            if sentence not in figures:
+                figures.append(sentence)
+        if len(figures) >= max_figures:
+            break
+    return figures
+
+
+def fetch_page(url, deadline, timeout=5, max_bytes=1_000_000, per_domain_limit=2):
+    """
+    Stream a single page with a size cap and a hard deadline.
+    Returns a dict with the extracted content and fetch stats.
+    """
+    start = time.monotonic()
+    result = {'url': url, 'ok': False, 'bytes': 0, 'elapsed': 0.0, 'title': '', 'text': '', 'figures': [],
+              'error': None}
+
+    domain = urlparse(url).netloc.lower()
+    acquired = _acquire_domain_slot(domain, per_domain_limit, max(deadline - time.monotonic(), 0))
+    if not acquired:
+        result['error'] = "Deadline reached waiting for domain slot"
+        result['elapsed'] = time.monotonic() - start
+        return result
+
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Deadline reached before request")
+
+        session = get_session()
+        with session.get(url, stream=True, timeout=min(timeout, remaining), allow_redirects=True) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '')
+            if content_type and 'html' not in content_type and 'text' not in content_type:
+                raise ValueError(f"Unsupported content type: {content_type}")
+
+            chunks = []
+            # read1 returns whatever has arrived instead of blocking until a full chunk,
+            # so the deadline is checked even when the server trickles data
+            raw = response.raw
+            read = getattr(raw, 'read1', raw.read)
+            while True:
+                chunk = read(16384, decode_content=True)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                result['bytes'] += len(chunk)
+                if result['bytes'] >= max_bytes:
+                    break
+                if time.monotonic() >= deadline:
+                    break
+
+            body = b''.join(chunks)[:max_bytes]
+            html = body.decode(_detect_encoding(content_type, body), errors='replace')
+
+        title, text = extract_main_text(html)
+        result['title'] = title
+        result['text'] = text
+        result['figures'] = extract_key_figures(text)
+        result['ok'] = bool(text)
+        if not text:
+            result['error'] = "No readable text"
+
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        _release_domain_slot(domain)
+        result['elapsed'] = time.monotonic() - start
+
+    return result
+
+
+def deep_fetch(urls, top_k=3, total_timeout=8, timeout=5, max_bytes=1_000_000, per_domain_limit=2,
+               max_workers=4):
+    """
+    Fetch the top-K URLs concurrently and extract their main text and key figures.
+    Fetches still running when the total deadline expires are reported as timed out.
+    """
+    urls = [url for url in urls if url and url.startswith(('http://', 'https://'))][:top_k]
+    if not urls:
+        return []
+
+    deadline = time.monotonic() + total_timeout
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    futures = {
+        executor.submit(fetch_page, url, deadline, timeout, max_bytes, per_domain_limit): url
+        for url in urls
+    }
+    wait(futures, timeout=total_timeout)
+    # Do not block the turn on stragglers; they stop at the deadline on their own
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for future, url in futures.items():
+        if future.done() and not future.cancelled():
+            results.append(future.result())
+        else:
+            results.append({'url': url, 'ok': False, 'bytes': 0, 'elapsed': float(total_timeout), 'title': '',
+                            'text': '', 'figures': [], 'error': "Total deadline exceeded"})
+
+    for res in results:
+        status = "✅" if res['ok'] else f"❌ {res['error']}"
+        print(f"🌐 Fetched {res['url']} - {res['bytes']} bytes in {res['elapsed']:.2f}s {status}")
+
+    return results
+
+
+def format_fetched_pages(pages, max_chars=1200):
+    """
+    Format deep-fetch results as prompt context
+    """
+    formatted = ""
+    for page in pages:
+        if not page['ok']:
+            continue
+        title = page['title'] or page['url']
+        formatted += f"📄 {title}\n   🔗 {page['url']}\n"
+        if page['figures']:
+            formatted += "   📈 Key figures:\n"
+            for figure in page['figures']:
+                formatted += f"     - {figure}\n"
+        formatted += f"   {page['text'][:max_chars]}\n\n"
+
+    if not formatted:
+        return ""
+    return f"📚 Full-page extracts:\n\n{formatted}"
@@ -0,0 +1,22 @@
+# [file name]: lazy.py
+import importlib
+import sys
+import time
+
+# Seconds spent on the first import of each lazily loaded module
+IMPORT_TIMES = {}
+
+
+def lazy_import(name):
+    """
+    Import a heavy module on first use and record how long the import took
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES[name] = time.perf_counter() - start
+    print(f"📦 Loaded {name} in {IMPORT_TIMES[name]:.2f}s")
+    return module
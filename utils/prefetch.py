@@ -0,0 +1,215 @@
+# [file name]: prefetch.py
+from utils.tools import search_web, fast_company_search, company_query
+from contextlib import contextmanager
+import threading
+import random
+import time
+import os
+import re
+
+# Interactive turns currently running; background refreshes wait while this is non-zero
+_interactive_turns = 0
+_interactive_lock = threading.Lock()
+
+
+@contextmanager
+def interactive_turn():
+    """Mark an interactive turn so background refreshes yield to it."""
+    global _interactive_turns
+    with _interactive_lock:
+        _interactive_turns += 1
+    try:
+        yield
+    finally:
+        with _interactive_lock:
+            _interactive_turns -= 1
+
+
+def _interactive_busy():
+    with _interactive_lock:
+        return _interactive_turns > 0
+
+
+class WatchlistPrefetcher:
+    """
+    Keeps search data for a watchlist of companies warm in the background.
+    Each company is refreshed every `refresh_interval` seconds (± jitter), with at
+    least `min_request_gap` seconds between outgoing searches.
+    """
+
+    def __init__(self, refresh_interval=20 * 60, jitter=0.2, min_request_gap=5, stale_after=None,
+                 max_companies=25):
+        self.refresh_interval = refresh_interval
+        self.jitter = jitter
+        self.min_request_gap = min_request_gap
+        self.stale_after = stale_after or refresh_interval * 1.5
+        self.max_companies = max_companies
+        self.store = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._last_request = 0.0
+        self._thread = None
+
+    def add_companies(self, companies):
+        """
+        Merge companies into the process-wide watchlist; new ones are fetched on the next pass.
+        Sessions share one prefetcher, so a session can add to the list but never shrink it.
+        """
+        companies = {name.strip().lower() for name in companies if name and name.strip()}
+        with self._lock:
+            for company in companies:
+                if company in self.store:
+                    continue
+                if len(self.store) >= self.max_companies:
+                    print(f"Watchlist full ({self.max_companies}), not adding {company}")
+                    break
+                self.store[company] = {'data': None, 'refreshed_at': None, 'next_due': 0.0,
+                                       'refresh_count': 0, 'failures': 0, 'last_duration': None}
+        self._wake.set()
+
+    @staticmethod
+    def _mentions(company, text):
+        # Whole words only: "Intel" must not match "intelligence", nor "Meta" "metadata"
+        return re.search(rf'\b{re.escape(company)}\b', text) is not None
+
+    @property
+    def watchlist(self):
+        with self._lock:
+            return sorted(self.store)
+
+    def start(self):
+        """Start the background refresh thread if it is not running."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="watchlist-prefetch")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _next_company(self):
+        """Most overdue company, or (None, seconds until the next one is due)."""
+        now = time.time()
+        with self._lock:
+            if not self.store:
+                return None, self.refresh_interval
+            company, entry = min(self.store.items(), key=lambda item: item[1]['next_due'])
+            if entry['next_due'] <= now:
+                return company, 0
+            return None, entry['next_due'] - now
+
+    def _run(self):
+        while not self._stop.is_set():
+            company, wait_for = self._next_company()
+            if company is None:
+                self._wake.wait(timeout=min(wait_for, 60))
+                self._wake.clear()
+                continue
+
+            # Low priority: let interactive turns finish first
+            while _interactive_busy() and not self._stop.is_set():
+                self._stop.wait(timeout=1)
+
+            # Rate limit outgoing searches
+            gap = self.min_request_gap - (time.time() - self._last_request)
+            if gap > 0 and self._stop.wait(timeout=gap):
+                break
+
+            self.refresh(company)
+
+    def refresh(self, company):
+        """Run the standard company queries and store the results."""
+        start = time.time()
+        data = None
+        try:
+            quick = fast_company_search(company, max_age=0)
+            self._last_request = time.time()
+            self._stop.wait(timeout=self.min_request_gap)
+            detailed = search_web(company_query(company))
+            self._last_request = time.time()
+
+            quick_ok = not quick.startswith(("Quick search failed", "No recent data"))
+            detailed_ok = not detailed.startswith(("Search unavailable", "No quick results"))
+            if quick_ok or detailed_ok:
+                data = f"{quick}\n{detailed}"
+        except Exception as e:
+            print(f"Watchlist refresh failed for {company}: {e}")
+
+        now = time.time()
+        interval = self.refresh_interval * (1 + random.uniform(-self.jitter, self.jitter))
+        with self._lock:
+            entry = self.store.get(company)
+            if entry is None:
+                return
+            entry['last_duration'] = now - start
+            if data:
+                entry['data'] = data
+                entry['refreshed_at'] = now
+                entry['refresh_count'] += 1
+                entry['next_due'] = now + interval
+            else:
+                entry['failures'] += 1
+                # Retry sooner than a full interval, but back off on repeated failures
+                entry['next_due'] = now + min(interval, 60 * entry['failures'])
+
+        print(f"♻️ Watchlist refresh {company}: {'ok' if data else 'failed'} in {now - start:.2f}s")
+
+    def get_warm_data(self, user_input):
+        """
+        Return fresh prefetched data for watchlist companies mentioned in the input, or None
+        """
+        user_lower = user_input.lower()
+        now = time.time()
+        found = []
+        with self._lock:
+            for company, entry in self.store.items():
+                if not self._mentions(company, user_lower):
+                    continue
+                if entry['data'] and now - entry['refreshed_at'] <= self.stale_after:
+                    found.append(entry['data'])
+
+            if found:
+                self.hits += 1
+            elif any(self._mentions(company, user_lower) for company in self.store):
+                self.misses += 1
+
+        return "\n".join(found) if found else None
+
+    def get_metrics(self):
+        """Staleness and refresh stats per company, plus warm hit/miss counts."""
+        now = time.time()
+        with self._lock:
+            companies = {}
+            for company, entry in self.store.items():
+                age = now - entry['refreshed_at'] if entry['refreshed_at'] else None
+                companies[company] = {
+                    'age_seconds': age,
+                    'stale': age is None or age > self.stale_after,
+                    'refresh_count': entry['refresh_count'],
+                    'failures': entry['failures'],
+                    'last_duration': entry['last_duration'],
+                    'next_refresh_in': max(entry['next_due'] - now, 0),
+                }
+            return {'companies': companies, 'hits': self.hits, 'misses': self.misses,
+                    'running': bool(self._thread and self._thread.is_alive())}
+
+
+# Global instance - one background scheduler per process
+_prefetcher = None
+
+
+def get_prefetcher():
+    """
+    Get the singleton watchlist prefetcher.
+    The base watchlist comes from the WATCHLIST environment variable (comma-separated).
+    """
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = WatchlistPrefetcher()
+        _prefetcher.add_companies(os.environ.get("WATCHLIST", "").split(","))
+    return _prefetcher
@@ -0,0 +1,158 @@
+# [file name]: resilience.py
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import threading
+import time
+
+
+class StageTimeout(Exception):
+    """Raised when a stage overruns its time budget."""
+
+
+class CircuitOpen(Exception):
+    """Raised when a backend's circuit breaker is open."""
+
+
+# Shared pool for stage calls; overrunning calls are abandoned, not joined
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="stage")
+
+
+def run_with_timeout(func, timeout, *args, **kwargs):
+    """
+    Run func in the stage pool and wait at most `timeout` seconds for it.
+    Raises StageTimeout if it overruns; the call is cancelled if it has not started yet.
+    """
+    if timeout <= 0:
+        raise StageTimeout("No time left in budget")
+
+    future = _executor.submit(func, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise StageTimeout(f"Stage exceeded {timeout:.1f}s budget")
+
+
+class TurnBudget:
+    """
+    Splits one overall deadline across named stages by weight.
+    `min_timeouts` gives stages a floor. Floors are scaled down when together they
+    exceed the deadline, and a stage never eats into the floors of the stages after it.
+    """
+
+    def __init__(self, total_seconds, weights, min_timeouts=None):
+        self.deadline = time.monotonic() + total_seconds
+        self.weights = dict(weights)
+        min_timeouts = {stage: seconds for stage, seconds in (min_timeouts or {}).items() if stage in self.weights}
+        total_floor = sum(min_timeouts.values())
+        scale = min(1.0, total_seconds / total_floor) if total_floor else 1.0
+        self.min_timeouts = {stage: seconds * scale for stage, seconds in min_timeouts.items()}
+
+    def remaining(self):
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def stage_timeout(self, stage):
+        """
+        Time for this stage: its share of what is left, so time saved by
+        earlier stages rolls forward to later ones.
+        """
+        stage_names = list(self.weights)
+        pending = stage_names[stage_names.index(stage):]
+        total_weight = sum(self.weights[name] for name in pending)
+        remaining = self.remaining()
+        if not total_weight:
+            return remaining
+        share = remaining * self.weights[stage] / total_weight
+        # Keep the later stages' floors available to them
+        reserved = sum(self.min_timeouts.get(name, 0) for name in pending[1:])
+        timeout = min(max(share, self.min_timeouts.get(stage, 0)), remaining - reserved)
+        return max(timeout, 0.0)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend after repeated failures.
+    After `reset_timeout` seconds one trial call is let through (half-open); other
+    callers are rejected until that trial finishes.
+    A stage timeout counts as a failure only when the call had at least
+    `slow_call_timeout` seconds, so a hung backend opens the breaker but one stage
+    with a short budget cannot trip it for every session.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=60, slow_call_timeout=8):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_timeout = slow_call_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow_request(self):
+        """Whether a call may go through; claims the single trial slot when half-open."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_neutral(self):
+        """Call ended without telling us anything about the backend (e.g. stage timeout)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._trial_in_flight = False
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"⚡ Circuit breaker '{self.name}' opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+    def call(self, func, timeout, *args, **kwargs):
+        """Run func under a timeout, tracking success and failure."""
+        if not self.allow_request():
+            raise CircuitOpen(f"{self.name} is temporarily disabled after repeated failures")
+        try:
+            result = run_with_timeout(func, timeout, *args, **kwargs)
+        except StageTimeout:
+            if timeout >= self.slow_call_timeout:
+                self.record_failure()
+            else:
+                self.record_neutral()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, failure_threshold=3, reset_timeout=60):
+    """Get the process-wide circuit breaker for a backend."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        return _breakers[name]
@@ -1,28 +1,42 @@
 # [file name]: tools.py
-from ddgs import DDGS
+from utils.lazy import lazy_import
+from collections import OrderedDict
+import threading
 import time
 import re
 
+# Last successful results per query, least recently used first: {query: (timestamp, formatted)}
+_search_cache = OrderedDict()
+_search_cache_lock = threading.Lock()
+SEARCH_CACHE_MAX_ENTRIES = 256
+SEARCH_CACHE_MAX_AGE = 6 * 3600
 
-def search_web(query, max_results=3):
+# How long prefetched company data counts as warm for interactive searches
+WARM_CACHE_TTL = 30 * 60
+
+
+def search_web(query, max_results=3, deep_fetch=False, fetch_top_k=3, max_age=0, fetch_stats=None):
     """
-    Clean, fast web search using DDGS
+    Clean, fast web search using DDGS.
+    With deep_fetch, the top result pages are also downloaded and their main text appended;
+    pass a list as fetch_stats to receive per-page url/ok/bytes/elapsed/error.
+    With max_age, cached results younger than max_age seconds are returned without searching.
     """
     # VALIDATE: Ensure query is not AI reasoning text
-    if len(query) > 100 or any(phrase in query.lower() for phrase in [
-        'here are', 'effective web search', 'search query', 'user input interpretation'
-    ]):
-        # If it's AI reasoning, extract the actual search intent
-        clean_query = _extract_clean_query(query)
-        if not clean_query:
-            return "Search query too complex - using internal knowledge"
-        query = clean_query
+    query = _normalize_query(query)
+    if not query:
+        return "Search query too complex - using internal knowledge"
+
+    if max_age:
+        cached = _cache_get(query, max_age)
+        if cached:
+            return cached
 
     print(f"🔍 Searching for: '{query}'")
 
     try:
         # USING DDGS (new package name)
-        with DDGS() as ddgs:
+        with lazy_import("ddgs").DDGS() as ddgs:
             results = []
             # DDGS returns a generator, so we need to collect results
             for result in ddgs.text(query, max_results=max_results):
@@ -44,12 +58,73 @@ def search_web(query, max_results=3):
             formatted += f"   📝 {snippet}\n"
             formatted += f"   🔗 {url}\n\n"
 
+        if deep_fetch:
+            # Deep fetch pulls in the HTTP client, so load it only when used
+            fetch = lazy_import("utils.fetch")
+            pages = fetch.deep_fetch([res.get('href', '') for res in results], top_k=fetch_top_k)
+            total_bytes = sum(page['bytes'] for page in pages)
+            slowest = max((page['elapsed'] for page in pages), default=0.0)
+            print(f"📥 Deep fetch: {len(pages)} pages, {total_bytes / 1024:.1f} KB, {slowest:.2f}s")
+            if fetch_stats is not None:
+                fetch_stats.extend({key: page[key] for key in ('url', 'ok', 'bytes', 'elapsed', 'error')}
+                                   for page in pages)
+            formatted += fetch.format_fetched_pages(pages)
+
+        _cache_put(query, formatted)
         return formatted
 
     except Exception as e:
         return f"Search unavailable: {str(e)}"
 
 
+def get_cached_search(query, max_age=SEARCH_CACHE_MAX_AGE):
+    """
+    Return the last successful search results for a query, or None if missing or stale
+    """
+    query = _normalize_query(query)
+    if not query:
+        return None
+    return _cache_get(query, max_age)
+
+
+def _cache_get(key, max_age):
+    key = key.lower()
+    with _search_cache_lock:
+        cached = _search_cache.get(key)
+        if not cached:
+            return None
+        _search_cache.move_to_end(key)
+
+    stored_at, formatted = cached
+    if time.time() - stored_at > max_age:
+        return None
+    return formatted
+
+
+def _cache_put(key, formatted):
+    """Store results, dropping expired entries and then the least recently used over the cap."""
+    now = time.time()
+    with _search_cache_lock:
+        _search_cache[key.lower()] = (now, formatted)
+        _search_cache.move_to_end(key.lower())
+        for old_key in [k for k, (stored_at, _) in _search_cache.items() if now - stored_at > SEARCH_CACHE_MAX_AGE]:
+            del _search_cache[old_key]
+        while len(_search_cache) > SEARCH_CACHE_MAX_ENTRIES:
+            _search_cache.popitem(last=False)
+
+
+def _normalize_query(query):
+    """
+    Reduce AI reasoning text to the actual search query
+    """
+    if len(query) > 100 or any(phrase in query.lower() for phrase in [
+        'here are', 'effective web search', 'search query', 'user input interpretation'
+    ]):
+        # If it's AI reasoning, extract the actual search intent
+        return _extract_clean_query(query)
+    return query
+
+
 def _extract_clean_query(ai_reasoning_text):
     """
     Extract clean search query from AI reasoning text
@@ -91,20 +166,34 @@ def smart_company_search(user_input):
     # Find mentioned company
     for company in companies:
         if company in user_lower:
-            return search_web(f"{company} company news financial 2024")
+            return search_web(company_query(company), max_age=WARM_CACHE_TTL)
 
     # Generic company research - take first 3-4 words max
     words = user_input.split()[:4]
     base_query = " ".join(words)
-    return search_web(f"{base_query} company business news")
+    return search_web(f"{base_query} company business news", max_age=WARM_CACHE_TTL)
 
 
-def fast_company_search(company_name):
+def company_query(company_name):
     """
-    Ultra-fast company-specific search
+    Standard research query for a company
     """
+    return f"{company_name} company news financial 2024"
+
+
+def fast_company_search(company_name, max_age=WARM_CACHE_TTL):
+    """
+    Ultra-fast company-specific search.
+    Returns warm cached data when it is younger than max_age seconds.
+    """
+    cache_key = f"fast:{company_name}"
+    if max_age:
+        cached = _cache_get(cache_key, max_age)
+        if cached:
+            return cached
+
     try:
-        with DDGS() as ddgs:
+        with lazy_import("ddgs").DDGS() as ddgs:
             results = []
             query = f"{company_name} company latest news financial 2024"
 
@@ -124,6 +213,7 @@ def fast_company_search(company_name):
             if snippet:
                 formatted += f"  {snippet}...\n"
 
+        _cache_put(cache_key, formatted)
         return formatted
 
     except Exception as e:
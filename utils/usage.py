@@ -0,0 +1,199 @@
+# [file name]: usage.py
+import threading
+import math
+
+# USD per 1M tokens for gemini-2.5-flash (input, output)
+PRICE_PER_MILLION = {"input": 0.30, "output": 2.50}
+
+
+def estimate_tokens(text):
+    """Rough local token estimate (~4 characters per token)."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / 4)
+
+
+def usage_from_response(response, prompt):
+    """
+    Prompt/output token counts for a Gemini response.
+    Uses the SDK's usage_metadata when present, otherwise the local estimator.
+    """
+    metadata = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(metadata, 'prompt_token_count', None) if metadata else None
+    total_tokens = getattr(metadata, 'total_token_count', None) if metadata else None
+    candidates_tokens = getattr(metadata, 'candidates_token_count', None) if metadata else None
+    if prompt_tokens is not None and total_tokens:
+        # Everything past the prompt is billed as output, including thinking tokens
+        return prompt_tokens, total_tokens - prompt_tokens, "sdk"
+    if prompt_tokens is not None and candidates_tokens is not None:
+        thoughts_tokens = getattr(metadata, 'thoughts_token_count', None) or 0
+        return prompt_tokens, candidates_tokens + thoughts_tokens, "sdk"
+
+    try:
+        text = response.text
+    except Exception:
+        text = ""
+    return estimate_tokens(prompt), estimate_tokens(text), "estimate"
+
+
+def fit_to_budget(text, max_tokens):
+    """Trim text so its estimated size stays within max_tokens."""
+    if max_tokens <= 0:
+        return ""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "\n[...trimmed to fit token budget...]"
+
+
+class UsageTracker:
+    """
+    Token counts per call, aggregated per turn, stage and persona for one session.
+    Calls made outside a turn (e.g. persona updates on rerun) are recorded as turn 0,
+    session overhead: they count toward the session budget but not any turn's.
+    """
+
+    SESSION_OVERHEAD = 0
+
+    def __init__(self):
+        self.calls = []
+        self.turn = 0
+        self._lock = threading.Lock()
+
+    def start_turn(self):
+        with self._lock:
+            self.turn += 1
+            return self.turn
+
+    def record(self, stage, persona, prompt_tokens, output_tokens, source, turn=None):
+        with self._lock:
+            self.calls.append({
+                'turn': self.SESSION_OVERHEAD if turn is None else turn,
+                'stage': stage,
+                'persona': persona,
+                'prompt_tokens': prompt_tokens,
+                'output_tokens': output_tokens,
+                'source': source,
+            })
+
+    def _total(self, calls):
+        prompt_tokens = sum(call['prompt_tokens'] for call in calls)
+        output_tokens = sum(call['output_tokens'] for call in calls)
+        cost = (prompt_tokens * PRICE_PER_MILLION["input"] + output_tokens * PRICE_PER_MILLION["output"]) / 1_000_000
+        return {'prompt_tokens': prompt_tokens, 'output_tokens': output_tokens,
+                'total_tokens': prompt_tokens + output_tokens, 'cost_usd': cost, 'calls': len(calls)}
+
+    def turn_tokens(self, turn):
+        with self._lock:
+            return sum(call['prompt_tokens'] + call['output_tokens'] for call in self.calls if call['turn'] == turn)
+
+    def session_tokens(self):
+        with self._lock:
+            return sum(call['prompt_tokens'] + call['output_tokens'] for call in self.calls)
+
+    def summary(self):
+        """Session totals plus breakdowns by stage and persona."""
+        with self._lock:
+            calls = list(self.calls)
+
+        by_stage = {}
+        by_persona = {}
+        for call in calls:
+            by_stage.setdefault(call['stage'], []).append(call)
+            by_persona.setdefault(call['persona'], []).append(call)
+
+        return {
+            'session': self._total(calls),
+            'by_stage': {stage: self._total(items) for stage, items in by_stage.items()},
+            'by_persona': {persona: self._total(items) for persona, items in by_persona.items()},
+            'estimated_calls': sum(1 for call in calls if call['source'] == "estimate"),
+        }
+
+
+class PendingCall:
+    """
+    Usage of one model call that its stage may abandon at the deadline.
+    The abandoned request is still billed, so its prompt is recorded as an estimate
+    right away; if the reply arrives later, only its output is added.
+    Calls that never started (no time left, or cancelled in the queue) record nothing.
+    """
+
+    def __init__(self, tracker, stage, persona, turn=None, prompt_estimate=0):
+        self.tracker = tracker
+        self.stage = stage
+        self.persona = persona
+        self.turn = turn
+        self.prompt_estimate = prompt_estimate
+        self._started = False
+        self._abandoned = False
+        self._done = False
+        self._lock = threading.Lock()
+
+    def start(self, extra_prompt_tokens=0):
+        """Mark the request as sent; extra_prompt_tokens covers e.g. chat history sent with it."""
+        with self._lock:
+            self._started = True
+            self.prompt_estimate += extra_prompt_tokens
+
+    def complete(self, prompt_tokens, output_tokens, source):
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+            if self._abandoned:
+                prompt_tokens = 0
+        self.tracker.record(self.stage, self.persona, prompt_tokens, output_tokens, source, self.turn)
+
+    def abandon(self):
+        with self._lock:
+            if not self._started or self._done or self._abandoned:
+                return
+            self._abandoned = True
+        self.tracker.record(self.stage, self.persona, self.prompt_estimate, 0, "estimate", self.turn)
+
+
+class BudgetGovernor:
+    """
+    Enforces per-turn and per-session token budgets.
+    Near the limits it shrinks context and skips optional stages; past them it refuses.
+    Use None to disable a budget.
+    """
+
+    def __init__(self, max_turn_tokens=20000, max_session_tokens=500000, output_reserve=2000):
+        self.max_turn_tokens = max_turn_tokens
+        self.max_session_tokens = max_session_tokens
+        self.output_reserve = output_reserve
+
+    def remaining(self, tracker, turn):
+        """Tokens still available to this turn, or None if unlimited."""
+        limits = []
+        if self.max_turn_tokens is not None:
+            limits.append(self.max_turn_tokens - tracker.turn_tokens(turn))
+        if self.max_session_tokens is not None:
+            limits.append(self.max_session_tokens - tracker.session_tokens())
+        return min(limits) if limits else None
+
+    def plan_turn(self, tracker):
+        """
+        'full' when there is headroom, 'lean' when optional stages should be skipped,
+        'refuse' when the session budget is spent.
+        """
+        if self.max_session_tokens is not None:
+            session_left = self.max_session_tokens - tracker.session_tokens()
+            if session_left <= self.output_reserve:
+                return "refuse"
+            if self.max_turn_tokens is not None and session_left < self.max_turn_tokens:
+                return "lean"
+        return "full"
+
+    def allow_optional(self, tracker, turn):
+        """Whether there is room left for an optional stage this turn."""
+        remaining = self.remaining(tracker, turn)
+        return remaining is None or remaining > self.output_reserve * 2
+
+    def prompt_budget(self, tracker, turn):
+        """Max prompt tokens for the final generation call, or None if unlimited."""
+        remaining = self.remaining(tracker, turn)
+        if remaining is None:
+            return None
+        return max(remaining - self.output_reserve, 0)